@@ -207,6 +207,12 @@ def map_nominal(genotype_df, variant_df, phenotype_df, phenotype_pos_df, prefix,
         var_dict = dict(var_dict)
 
     igc = genotypeio.InputGeneratorCis(genotype_df, variant_df, phenotype_df, phenotype_pos_df, group_s=group_s, window=window)
+    # group phenotype (or group representative) IDs by chromosome once,
+    # instead of re-scanning phenotype_pos_df['chr'] for each chromosome
+    if group_s is None:
+        chr_phenotype_ids = igc.phenotype_pos_df.groupby('chr', sort=False).groups
+    else:
+        chr_phenotype_ids = igc.phenotype_pos_df.loc[igc.group_s.drop_duplicates().index].groupby('chr', sort=False).groups
     # iterate over chromosomes
     best_assoc = []
     start_time = time.time()
@@ -216,14 +222,9 @@ def map_nominal(genotype_df, variant_df, phenotype_df, phenotype_pos_df, prefix,
         logger.write(f'    Mapping chromosome {chrom}')
         # allocate arrays
         n = 0  # number of pairs
-        if group_s is None:
-            for i in igc.phenotype_pos_df[igc.phenotype_pos_df['chr'] == chrom].index:
-                j = igc.cis_ranges[i]
-                n += j[1] - j[0] + 1
-        else:
-            for i in igc.group_s[igc.phenotype_pos_df['chr'] == chrom].drop_duplicates().index:
-                j = igc.cis_ranges[i]
-                n += j[1] - j[0] + 1
+        for i in chr_phenotype_ids.get(chrom, []):
+            j = igc.cis_ranges[i]
+            n += j[1] - j[0] + 1
 
         chr_res = OrderedDict()
         chr_res['phenotype_id'] = []
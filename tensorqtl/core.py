@@ -6,6 +6,7 @@ import scipy.optimize
 from scipy.special import loggamma
 import sys
 import re
+import gzip
 import subprocess
 
 # check R
@@ -150,8 +151,9 @@ def calculate_corr(genotype_t, phenotype_t, residualizer=None, return_var=False)
         phenotype_res_t = phenotype_t
 
     if return_var:
-        genotype_var_t = genotype_res_t.var(1)
-        phenotype_var_t = phenotype_res_t.var(1)
+        # cast back to float32 in case of autocast (no-op otherwise)
+        genotype_var_t = genotype_res_t.var(1).float()
+        phenotype_var_t = phenotype_res_t.var(1).float()
 
     # center and normalize
     genotype_res_t = center_normalize(genotype_res_t, dim=1)
@@ -159,9 +161,9 @@ def calculate_corr(genotype_t, phenotype_t, residualizer=None, return_var=False)
 
     # correlation
     if return_var:
-        return torch.mm(genotype_res_t, phenotype_res_t.t()), genotype_var_t, phenotype_var_t
+        return torch.mm(genotype_res_t, phenotype_res_t.t()).float(), genotype_var_t, phenotype_var_t
     else:
-        return torch.mm(genotype_res_t, phenotype_res_t.t())
+        return torch.mm(genotype_res_t, phenotype_res_t.t()).float()
 
 
 def get_t_pval(t, df, log=False):
@@ -231,7 +233,8 @@ def calculate_interaction_nominal(genotypes_t, phenotypes_t, interaction_t, resi
 
     # calculate b, b_se
     # [(ng x nb x nb) x (ng x nb x ns)] x (ng x ns x np) = (ng x nb x np)
-    b_t = torch.matmul(torch.matmul(Xinv, torch.transpose(X_t, 1, 2)), torch.transpose(p0_tile_t, 1, 2))
+    # cast back to float32 in case of autocast (no-op otherwise)
+    b_t = torch.matmul(torch.matmul(Xinv, torch.transpose(X_t, 1, 2)), torch.transpose(p0_tile_t, 1, 2)).float()
     nb = b_t.shape[1]
     # residualizer.dof already includes intercept, b_g, add b_i and b_gi for each interaction
     if residualizer is not None:
@@ -239,9 +242,9 @@ def calculate_interaction_nominal(genotypes_t, phenotypes_t, interaction_t, resi
     else:
         dof = phenotypes_t.shape[1] - 2 - 2*ni
     if nps == 1:  # single phenotype case
-        r_t = torch.matmul(X_t, b_t).squeeze() - p0_t
+        r_t = torch.matmul(X_t, b_t).squeeze().float() - p0_t
         rss_t = (r_t*r_t).sum(1)
-        b_se_t = torch.sqrt(Xinv[:, torch.eye(nb, dtype=torch.uint8).bool()] * rss_t.unsqueeze(1) / dof)
+        b_se_t = torch.sqrt(Xinv.float()[:, torch.eye(nb, dtype=torch.uint8).bool()] * rss_t.unsqueeze(1) / dof)
         b_t = b_t.squeeze(2)
         # r_t = tf.squeeze(tf.matmul(X_t, b_t)) - p0_t  # (ng x ns x 3) x (ng x 3 x 1)
         # rss_t = tf.reduce_sum(tf.multiply(r_t, r_t), axis=1)
@@ -249,9 +252,9 @@ def calculate_interaction_nominal(genotypes_t, phenotypes_t, interaction_t, resi
     else:
         # b_t = tf.matmul(p0_tile_t, tf.matmul(Xinv, X_t, transpose_b=True), transpose_b=True)
         # convert to ng x np x 3??
-        r_t = torch.matmul(X_t, b_t) - torch.transpose(p0_tile_t, 1, 2)  # (ng x ns x np)
+        r_t = torch.matmul(X_t, b_t).float() - torch.transpose(p0_tile_t, 1, 2)  # (ng x ns x np)
         rss_t = (r_t*r_t).sum(1)  # ng x np
-        b_se_t = torch.sqrt(Xinv[:, torch.eye(nb, dtype=torch.uint8).bool()].unsqueeze(-1).repeat([1,1,nps]) * rss_t.unsqueeze(1).repeat([1,3,1]) / dof)
+        b_se_t = torch.sqrt(Xinv.float()[:, torch.eye(nb, dtype=torch.uint8).bool()].unsqueeze(-1).repeat([1,1,nps]) * rss_t.unsqueeze(1).repeat([1,3,1]) / dof)
         # b_se_t = tf.sqrt(tf.tile(tf.expand_dims(tf.matrix_diag_part(Xinv), 2), [1,1,nps]) * tf.tile(tf.expand_dims(rss_t, 1), [1,3,1]) / dof) # (ng x 3) -> (ng x 3 x np)
 
     tstat_t = (b_t.double() / b_se_t.double()).float()  # (ng x nb x np)
@@ -403,10 +406,51 @@ def calculate_beta_approx_pval(r2_perm, r2_nominal, dof_init, tol=1e-4):
 #  i/o functions
 #------------------------------------------------------------------------------
 
+def write_tsv(df, path, float_format='%.6g', index=True):
+    """Write a DataFrame to (gzipped) TSV.
+
+    Float columns are pre-formatted with a vectorized np.char.mod instead of pandas'
+    per-value float_format, which is substantially faster for large result tables.
+    """
+    df = df.copy(deep=False)
+    for c in df.columns:
+        if np.issubdtype(df[c].dtype, np.floating):
+            v = df[c].values.astype(np.float64)
+            s = np.char.mod(float_format, v)
+            s[np.isnan(v)] = ''
+            df[c] = s
+    df.to_csv(path, sep='\t', index=index)
+
+
+def read_matrix(path):
+    """Load a matrix (e.g., covariates) from tab-delimited, parquet, or feather input,
+    indexed by the first column."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    elif path.endswith(('.feather', '.ft')):
+        df = pd.read_feather(path)
+        return df.set_index(df.columns[0])
+    else:
+        return pd.read_csv(path, sep='\t', index_col=0)
+
+
 def read_phenotype_bed(phenotype_bed):
     """Load phenotype BED file as phenotype and position DataFrames"""
     if phenotype_bed.lower().endswith(('.bed.gz', '.bed')):
-        phenotype_df = pd.read_csv(phenotype_bed, sep='\t', index_col=3, dtype={'#chr':str, '#Chr':str})
+        # peek at the header to assign dtypes up front (positions as int32, phenotypes as float32)
+        if phenotype_bed.lower().endswith('.bed.gz'):
+            with gzip.open(phenotype_bed, 'rt') as f:
+                header = f.readline().strip().split('\t')
+        else:
+            with open(phenotype_bed) as f:
+                header = f.readline().strip().split('\t')
+        dtype_dict = {header[0]:str, header[1]:np.int32, header[2]:np.int32, header[3]:str}
+        dtype_dict.update({i:np.float32 for i in header[4:]})
+        try:  # use the multithreaded pyarrow parser when available
+            phenotype_df = pd.read_csv(phenotype_bed, sep='\t', dtype=dtype_dict, engine='pyarrow')
+        except ImportError:
+            phenotype_df = pd.read_csv(phenotype_bed, sep='\t', dtype=dtype_dict)
+        phenotype_df.set_index(header[3], inplace=True)
     elif phenotype_bed.lower().endswith('.bed.parquet'):
         phenotype_df = pd.read_parquet(phenotype_bed)
         phenotype_df.set_index(phenotype_df.columns[3], inplace=True)
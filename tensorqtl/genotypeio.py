@@ -1,3 +1,4 @@
+import torch
 import pandas as pd
 import tempfile
 import numpy as np
@@ -234,21 +235,40 @@ class PlinkReader(object):
         return pd.DataFrame(self.bed.compute(), index=self.bim['snp'], columns=self.fam['iid'])
 
 
-def load_genotypes(genotype_path, select_samples=None, dosages=False):
-    """Load all genotypes into a dataframe"""
+def load_genotypes(genotype_path, select_samples=None, dosages=False, as_tensor=False):
+    """Load all genotypes into a dataframe
+
+    With as_tensor=True (PLINK 1/2 inputs only), the genotypes are instead returned as
+    (genotypes_t, variant_df, sample_ids), where genotypes_t is a torch tensor built
+    directly from the raw genotype array, skipping the genotype DataFrame and its object
+    indexes. The tensor is allocated in pinned memory when CUDA is available, enabling
+    asynchronous copies via .to(device, non_blocking=True).
+    """
     if all([os.path.exists(f"{genotype_path}.{ext}") for ext in ['pgen', 'psam', 'pvar']]):
         if pgen is None:
             raise ImportError('Pgenlib must be installed to use PLINK 2 pgen/psam/pvar files.')
         pgr = pgen.PgenReader(genotype_path, select_samples=select_samples)
         variant_df = pgr.pvar_df.set_index('id')[['chrom', 'pos']]
-        if dosages:
+        if as_tensor:
+            if dosages:
+                genotypes = pgen.read_dosages_range(pgr.pgen_file, 0, pgr.num_variants-1, sample_subset=pgr.sample_idxs)
+            else:
+                genotypes = pgen.read_range(pgr.pgen_file, 0, pgr.num_variants-1, sample_subset=pgr.sample_idxs)
+            sample_ids = pgr.sample_ids
+        elif dosages:
             genotype_df = pgr.load_dosages()
         else:
             genotype_df = pgr.load_genotypes()
     elif all([os.path.exists(f"{genotype_path}.{ext}") for ext in ['bed', 'bim', 'fam']]):
         pr = PlinkReader(genotype_path, select_samples=select_samples, dtype=np.int8)
-        genotype_df = pr.load_genotypes()
         variant_df = pr.bim.set_index('snp')[['chrom', 'pos']]
+        if as_tensor:
+            genotypes = pr.bed.compute()
+            sample_ids = pr.sample_ids
+        else:
+            genotype_df = pr.load_genotypes()
+    elif as_tensor:
+        raise ValueError("as_tensor is only supported for PLINK pgen/psam/pvar and bed/bim/fam inputs.")
     elif genotype_path.endswith(('.bed.parquet', '.bed.gz', '.bed')):
         genotype_df, variant_df = read_phenotype_bed(genotype_path)
         assert variant_df.columns[1] == 'pos', "The BED file must define a single position for each variant, with start + 1 == end."
@@ -265,6 +285,11 @@ def load_genotypes(genotype_path, select_samples=None, dosages=False):
         variant_df = None
     else:
         raise ValueError(f"Failed to load genotypes from {genotype_path}. Supported formats: pgen/psam/pvar, bed/bim/fam, parquet, tsv.gz")
+    if as_tensor:
+        genotypes_t = torch.from_numpy(np.ascontiguousarray(genotypes))
+        if torch.cuda.is_available():
+            genotypes_t = genotypes_t.pin_memory()
+        return genotypes_t, variant_df, sample_ids
     return genotype_df, variant_df
 
 
@@ -528,12 +553,16 @@ def get_chunk_size(memory_gb, samples):
     return memory_gb * 1024**3 // samples
 
 
+@background(max_prefetch=1)
 def generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, chunk_size, window=1000000,
                            dosages=False, verbose=True):
     """
     Generate paired genotype-phenotype chunks for large datasets where only a subset of
     genotypes can be loaded into memory.
 
+    Chunks are read in a background thread (one chunk ahead), overlapping genotype I/O
+    with GPU compute on the current chunk.
+
     pgr: pgen.PgenReader
     phenotype_df:     phenotype DataFrame (phenotypes x samples)
     phenotype_pos_df: DataFrame defining position of each phenotype, with columns ['chr', 'pos'] or ['chr', 'start', 'end']
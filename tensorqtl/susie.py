@@ -113,8 +113,8 @@ def init_finalize(s, X_t=None, Xr_t=None):
 
 def compute_Xb(X_t, b_t, cm_t, csd_t):
     """Compute Xb with column standardized X"""
-    # scale Xb
-    scaled_Xb_t = torch.mm(X_t, (b_t/csd_t).reshape(-1,1)).squeeze()
+    # scale Xb; keep accumulators in float32 in case of autocast (.float() is a no-op otherwise)
+    scaled_Xb_t = torch.mm(X_t, (b_t/csd_t).reshape(-1,1)).squeeze().float()
     # center Xb
     Xb_t = scaled_Xb_t - (cm_t*b_t/csd_t).sum()
     return Xb_t
@@ -125,7 +125,7 @@ def compute_Xty(X_t, y_t, cm_t, csd_t):
     cm: column means of X
     csd: column SDs of X
     """
-    ytX_t = torch.mm(y_t.T, X_t)
+    ytX_t = torch.mm(y_t.T, X_t).float()  # float32 accumulator in case of autocast
     # scale Xty
     scaled_Xty_t = ytX_t.T / csd_t.reshape(-1,1)
     # center Xty
@@ -139,7 +139,7 @@ def compute_MXt(M_t, X_t, xattr):
     M: L x p matrix
     X: n x p matrix
     """
-    return torch.mm(M_t, (X_t / xattr['scaled_scale']).T) - torch.mm(M_t, (xattr['scaled_center']/xattr['scaled_scale']).reshape(-1,1))
+    return (torch.mm(M_t, (X_t / xattr['scaled_scale']).T) - torch.mm(M_t, (xattr['scaled_center']/xattr['scaled_scale']).reshape(-1,1))).float()
 
 
 def loglik(V, betahat, shat2, prior_weights):
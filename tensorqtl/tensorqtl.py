@@ -2,12 +2,16 @@
 from __future__ import print_function
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime
 import sys
 import os
 import re
+import gzip
 import pickle
 import argparse
+import contextlib
 from collections import defaultdict
 import importlib.metadata
 
@@ -17,6 +21,17 @@ from post import *
 import genotypeio, cis, trans, susie
 
 
+def read_cis_output(path):
+    """Load cis-QTL mapping output, preferring a parquet copy if one exists next to the TSV."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    elif path.endswith('.txt.gz') and os.path.exists(path.replace('.txt.gz', '.parquet')):
+        return pd.read_parquet(path.replace('.txt.gz', '.parquet'))
+    else:
+        df = pd.read_csv(path, sep='\t', engine='pyarrow')
+        return df.set_index(df.columns[0])
+
+
 def main():
     parser = argparse.ArgumentParser(description='tensorQTL: GPU-based QTL mapper')
     parser.add_argument('genotype_path', help='Genotypes in PLINK format')
@@ -41,6 +56,8 @@ def main():
     parser.add_argument('--best_only', action='store_true', help='Only write lead association for each phenotype (interaction mode only)')
     parser.add_argument('--output_text', action='store_true', help='Write output in txt.gz format instead of parquet (trans-QTL mode only)')
     parser.add_argument('--batch_size', type=int, default=20000, help='GPU batch size (trans-QTLs only). Reduce this if encountering OOM errors.')
+    parser.add_argument('--precision', default='fp32', type=str, choices=['fp32', 'bf16', 'fp16'],
+                        help="Compute precision for 'cis', 'cis_susie', and 'trans' modes. bf16/fp16 run the matmuls on tensor cores via autocast, with FP32 accumulation (GPU only). Default: fp32")
     parser.add_argument('--chunk_size', default=None, help="For cis-QTL mapping, load genotypes into CPU memory in chunks of chunk_size variants, or by chromosome if chunk_size is 'chr'.")
     parser.add_argument('--susie_loci', default=None, help="Table (parquet or tsv) with loci to fine-map (phenotype_id, chr, pos) with mode 'trans_susie'.")
     parser.add_argument('--disable_beta_approx', action='store_true', help='Disable Beta-distribution approximation of empirical p-values (not recommended).')
@@ -65,8 +82,22 @@ def main():
     else:
         logger.write('  * WARNING: using CPU!')
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # enable TF32 matrix multiplications (uses tensor cores on Ampere or newer GPUs;
+    # statistics are computed in float64 downstream)
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.set_float32_matmul_precision('high')
+    if args.precision != 'fp32' and torch.cuda.is_available():
+        logger.write(f'  * computing associations in {args.precision} (FP32 accumulation)')
+        amp_context = torch.autocast('cuda', dtype=torch.bfloat16 if args.precision == 'bf16' else torch.float16)
+    else:
+        amp_context = contextlib.nullcontext()
     if args.seed is not None:
         logger.write(f'  * using seed {args.seed}')
+        np.random.seed(args.seed)
+        torch.manual_seed(args.seed)
+        if torch.cuda.is_available():
+            torch.cuda.manual_seed_all(args.seed)
 
     # load inputs
     logger.write(f'  * reading phenotypes ({args.phenotypes})')
@@ -90,14 +121,18 @@ def main():
 
     if args.covariates is not None:
         logger.write(f'  * reading covariates ({args.covariates})')
-        covariates_df = pd.read_csv(args.covariates, sep='\t', index_col=0).T
+        covariates_df = read_matrix(args.covariates)  # covariates x samples
+        # transpose to samples x covariates in a single float32 allocation,
+        # rather than materializing both orientations
+        covariates_df = pd.DataFrame(np.ascontiguousarray(covariates_df.values.T, dtype=np.float32),
+                                     index=covariates_df.columns, columns=covariates_df.index)
         assert phenotype_df.columns.equals(covariates_df.index)
     else:
         covariates_df = None
 
     if args.paired_covariate is not None:
         assert covariates_df is not None, f"Covariates matrix must be provided when using paired covariate"
-        paired_covariate_df = pd.read_csv(args.paired_covariate, sep='\t', index_col=0)  # phenotypes x samples
+        paired_covariate_df = read_matrix(args.paired_covariate)  # phenotypes x samples
         assert paired_covariate_df.index.isin(phenotype_df.index).all(), f"Paired covariate phenotypes must be present in phenotype matrix."
         assert paired_covariate_df.columns.equals(phenotype_df.columns), f"Paired covariate samples must match samples in phenotype matrix."
     else:
@@ -105,14 +140,16 @@ def main():
 
     if args.interaction is not None:
         logger.write(f'  * reading interaction term(s) ({args.interaction})')
-        # allow headerless input for single interactions
-        with open(args.interaction) as f:
-            f.readline()
-            s = f.readline().strip()
-        if len(s.split('\t')) == 2:  # index + value
-            interaction_df = pd.read_csv(args.interaction, sep='\t', index_col=0, header=None)
+        if args.interaction.endswith(('.parquet', '.feather', '.ft')):
+            interaction_df = read_matrix(args.interaction)
         else:
-            interaction_df = pd.read_csv(args.interaction, sep='\t', index_col=0)
+            # allow headerless input for single interactions; peek at the first lines to detect format
+            open_fn = gzip.open if args.interaction.endswith('.gz') else open
+            with open_fn(args.interaction, 'rt') as f:
+                f.readline()
+                s = f.readline().strip()
+            header = None if len(s.split('\t')) == 2 else 0  # index + value --> no header
+            interaction_df = pd.read_csv(args.interaction, sep='\t', index_col=0, header=header)
         # select samples
         assert covariates_df.index.isin(interaction_df.index).all()
         interaction_df = interaction_df.loc[covariates_df.index].astype(np.float32)
@@ -129,14 +166,9 @@ def main():
 
     if args.phenotype_groups is not None:
         group_s = pd.read_csv(args.phenotype_groups, sep='\t', index_col=0, header=None).squeeze('columns').rename(None)
-        # verify sort order
-        group_dict = group_s.to_dict()
-        previous_group = ''
-        parsed_groups = 0
-        for i in phenotype_df.index:
-            if group_dict[i] != previous_group:
-                parsed_groups += 1
-                previous_group = group_dict[i]
+        # verify sort order: the number of group transitions must match the number of groups
+        groups = group_s.loc[phenotype_df.index].values
+        parsed_groups = int((groups[1:] != groups[:-1]).sum()) + 1
         if not parsed_groups == len(group_s.unique()):
             raise ValueError('Groups defined in input do not match phenotype file (check sort order).')
     else:
@@ -154,201 +186,214 @@ def main():
         import pgen
         pgr = pgen.PgenReader(args.genotype_path, select_samples=phenotype_df.columns)
 
-    if args.mode == 'cis':
-        if args.chunk_size is None:
-            res_df = cis.map_cis(genotype_df, variant_df, phenotype_df, phenotype_pos_df, covariates_df=covariates_df,
-                                 group_s=group_s, paired_covariate_df=paired_covariate_df, nperm=args.permutations,
-                                 window=args.window, beta_approx=not args.disable_beta_approx, maf_threshold=maf_threshold,
-                                 warn_monomorphic=args.warn_monomorphic, logger=logger, seed=args.seed, verbose=True)
-        else:
-            res_df = []
-            for gt_df, var_df, p_df, p_pos_df, _ in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
-                                                                                   dosages=args.dosages, verbose=True):
-                res_df.append(cis.map_cis(gt_df, var_df, p_df, p_pos_df, covariates_df=covariates_df,
-                                          group_s=group_s, paired_covariate_df=paired_covariate_df, nperm=args.permutations,
-                                          window=args.window, beta_approx=not args.disable_beta_approx, maf_threshold=maf_threshold,
-                                          warn_monomorphic=args.warn_monomorphic, logger=logger, seed=args.seed, verbose=True))
-            res_df = pd.concat(res_df)
-        logger.write('  * writing output')
-        if has_rpy2:
-            calculate_qvalues(res_df, fdr=args.fdr, qvalue_lambda=args.qvalue_lambda, logger=logger)
-        out_file = os.path.join(args.output_dir, f'{args.prefix}.cis_qtl.txt.gz')
-        res_df.to_csv(out_file, sep='\t', float_format='%.6g')
-
-    elif args.mode == 'cis_nominal':
-        if args.chunk_size is None:
-            cis.map_nominal(genotype_df, variant_df, phenotype_df, phenotype_pos_df, args.prefix, covariates_df=covariates_df,
-                            paired_covariate_df=paired_covariate_df, interaction_df=interaction_df,
-                            maf_threshold_interaction=args.maf_threshold_interaction,
-                            group_s=None, window=args.window, maf_threshold=maf_threshold, run_eigenmt=True,
-                            output_dir=args.output_dir, write_top=True, write_stats=not args.best_only, logger=logger, verbose=True)
-            # compute significant pairs
-            if args.cis_output is not None:
-                cis_df = pd.read_csv(args.cis_output, sep='\t', index_col=0)
-                nominal_prefix = os.path.join(args.output_dir, f'{args.prefix}.cis_qtl_pairs')
-                signif_df = get_significant_pairs(cis_df, nominal_prefix, group_s=group_s, fdr=args.fdr)
-                signif_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.cis_qtl.signif_pairs.parquet'))
-
-        else:
-            chunks = []
-            for gt_df, var_df, p_df, p_pos_df, ci in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
+    # no gradients are needed for any of the mapping modes
+    with torch.inference_mode():
+        if args.mode == 'cis':
+            if args.chunk_size is None:
+                with amp_context:
+                    res_df = cis.map_cis(genotype_df, variant_df, phenotype_df, phenotype_pos_df, covariates_df=covariates_df,
+                                         group_s=group_s, paired_covariate_df=paired_covariate_df, nperm=args.permutations,
+                                         window=args.window, beta_approx=not args.disable_beta_approx, maf_threshold=maf_threshold,
+                                         warn_monomorphic=args.warn_monomorphic, logger=logger, seed=args.seed, verbose=True)
+            else:
+                res_df = []
+                for gt_df, var_df, p_df, p_pos_df, _ in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
                                                                                        dosages=args.dosages, verbose=True):
-                prefix = f"{args.prefix}.chunk{ci+1}"
-                chunks.append(prefix)
-                cis.map_nominal(gt_df, var_df, p_df, p_pos_df, prefix, covariates_df=covariates_df,
+                    with amp_context:
+                        res_df.append(cis.map_cis(gt_df, var_df, p_df, p_pos_df, covariates_df=covariates_df,
+                                                  group_s=group_s, paired_covariate_df=paired_covariate_df, nperm=args.permutations,
+                                                  window=args.window, beta_approx=not args.disable_beta_approx, maf_threshold=maf_threshold,
+                                                  warn_monomorphic=args.warn_monomorphic, logger=logger, seed=args.seed, verbose=True))
+                res_df = pd.concat(res_df)
+            logger.write('  * writing output')
+            if has_rpy2:
+                calculate_qvalues(res_df, fdr=args.fdr, qvalue_lambda=args.qvalue_lambda, logger=logger)
+            out_file = os.path.join(args.output_dir, f'{args.prefix}.cis_qtl.txt.gz')
+            write_tsv(res_df, out_file)
+            # parquet copy for fast re-loading in cis_independent/cis_susie modes
+            res_df.to_parquet(out_file.replace('.txt.gz', '.parquet'))
+
+        elif args.mode == 'cis_nominal':
+            if args.chunk_size is None:
+                cis.map_nominal(genotype_df, variant_df, phenotype_df, phenotype_pos_df, args.prefix, covariates_df=covariates_df,
                                 paired_covariate_df=paired_covariate_df, interaction_df=interaction_df,
                                 maf_threshold_interaction=args.maf_threshold_interaction,
                                 group_s=None, window=args.window, maf_threshold=maf_threshold, run_eigenmt=True,
                                 output_dir=args.output_dir, write_top=True, write_stats=not args.best_only, logger=logger, verbose=True)
-            chunk_files = glob.glob(os.path.join(args.output_dir, f"{args.prefix}.chunk*.cis_qtl_pairs.*.parquet"))
-            if args.chunk_size == 'chr':  # remove redundant chunk ID from file names
-                for f in chunk_files:
-                    x = re.findall(f"{args.prefix}\.(chunk\d+)", os.path.basename(f))
-                    assert len(x) == 1
-                    os.rename(f, f.replace(f"{x[0]}.", ""))
-            else:  # concatenate outputs by chromosome
-                chunk_df = pd.DataFrame({
-                    'file': chunk_files,
-                    'chunk': [int(re.findall(f"{args.prefix}\.chunk(\d+)", os.path.basename(i))[0]) for i in chunk_files],
-                    'chr': [re.findall("\.cis_qtl_pairs\.(.*)\.parquet", os.path.basename(i))[0] for i in chunk_files],
-                }).sort_values('chunk')
-                for chrom, chr_df in chunk_df.groupby('chr', sort=False):
-                    print(f"\rConcatenating outputs for {chrom}", end='' if chrom != chunk_df['chr'].iloc[-1] else None)
-                    pd.concat([pd.read_parquet(f) for f in chr_df['file']]).reset_index(drop=True).to_parquet(
-                        os.path.join(args.output_dir, f"{args.prefix}.cis_qtl_pairs.{chrom}.parquet"))
-                    for f in chr_df['file']:
-                        os.remove(f)
-            # concatenate interaction results
-            if interaction_df is not None:
-                chunk_files = [os.path.join(args.output_dir, f"{c}.cis_qtl_top_assoc.txt.gz") for c in chunks]
-                pd.concat([pd.read_csv(f, sep='\t', index_col=0, dtype=str) for f in chunk_files]).to_csv(
-                    os.path.join(args.output_dir, f"{args.prefix}.cis_qtl_top_assoc.txt.gz"), sep='\t')
-                for f in chunk_files:
-                    os.remove(f)
+                # compute significant pairs
+                if args.cis_output is not None:
+                    cis_df = read_cis_output(args.cis_output)
+                    nominal_prefix = os.path.join(args.output_dir, f'{args.prefix}.cis_qtl_pairs')
+                    signif_df = get_significant_pairs(cis_df, nominal_prefix, group_s=group_s, fdr=args.fdr)
+                    signif_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.cis_qtl.signif_pairs.parquet'))
 
-    elif args.mode == 'cis_independent':
-        summary_df = pd.read_csv(args.cis_output, sep='\t', index_col=0)
-        summary_df.rename(columns={'minor_allele_samples':'ma_samples', 'minor_allele_count':'ma_count'}, inplace=True)
-        if args.chunk_size is None:
-            res_df = cis.map_independent(genotype_df, variant_df, summary_df, phenotype_df, phenotype_pos_df, covariates_df=covariates_df,
-                                         group_s=group_s, fdr=args.fdr, nperm=args.permutations, window=args.window,
-                                         maf_threshold=maf_threshold, logger=logger, seed=args.seed, verbose=True)
-        else:
-            res_df = []
-            for gt_df, var_df, p_df, p_pos_df, _ in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
-                                                                                      dosages=args.dosages, verbose=True):
-                res_df.append(cis.map_independent(gt_df, var_df, summary_df, p_df, p_pos_df, covariates_df=covariates_df,
-                                                  group_s=group_s, fdr=args.fdr, nperm=args.permutations, window=args.window,
-                                                  maf_threshold=maf_threshold, logger=logger, seed=args.seed, verbose=True))
-            res_df = pd.concat(res_df).reset_index(drop=True)
-        logger.write('  * writing output')
-        out_file = os.path.join(args.output_dir, f'{args.prefix}.cis_independent_qtl.txt.gz')
-        res_df.to_csv(out_file, sep='\t', index=False, float_format='%.6g')
+            else:
+                chunks = []
+                for gt_df, var_df, p_df, p_pos_df, ci in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
+                                                                                           dosages=args.dosages, verbose=True):
+                    prefix = f"{args.prefix}.chunk{ci+1}"
+                    chunks.append(prefix)
+                    cis.map_nominal(gt_df, var_df, p_df, p_pos_df, prefix, covariates_df=covariates_df,
+                                    paired_covariate_df=paired_covariate_df, interaction_df=interaction_df,
+                                    maf_threshold_interaction=args.maf_threshold_interaction,
+                                    group_s=None, window=args.window, maf_threshold=maf_threshold, run_eigenmt=True,
+                                    output_dir=args.output_dir, write_top=True, write_stats=not args.best_only, logger=logger, verbose=True)
+                chunk_files = glob.glob(os.path.join(args.output_dir, f"{args.prefix}.chunk*.cis_qtl_pairs.*.parquet"))
+                if args.chunk_size == 'chr':  # remove redundant chunk ID from file names
+                    for f in chunk_files:
+                        x = re.findall(f"{args.prefix}\.(chunk\d+)", os.path.basename(f))
+                        assert len(x) == 1
+                        os.rename(f, f.replace(f"{x[0]}.", ""))
+                else:  # concatenate outputs by chromosome
+                    chunk_df = pd.DataFrame({
+                        'file': chunk_files,
+                        'chunk': [int(re.findall(f"{args.prefix}\.chunk(\d+)", os.path.basename(i))[0]) for i in chunk_files],
+                        'chr': [re.findall("\.cis_qtl_pairs\.(.*)\.parquet", os.path.basename(i))[0] for i in chunk_files],
+                    }).sort_values('chunk')
+                    for chrom, chr_df in chunk_df.groupby('chr', sort=False):
+                        print(f"\rConcatenating outputs for {chrom}", end='' if chrom != chunk_df['chr'].iloc[-1] else None)
+                        # zero-copy concatenation of the chunked arrow tables, without round-tripping through pandas
+                        pq.write_table(pa.concat_tables([pq.read_table(f) for f in chr_df['file']]),
+                                       os.path.join(args.output_dir, f"{args.prefix}.cis_qtl_pairs.{chrom}.parquet"))
+                        for f in chr_df['file']:
+                            os.remove(f)
+                # concatenate interaction results
+                if interaction_df is not None:
+                    chunk_files = [os.path.join(args.output_dir, f"{c}.cis_qtl_top_assoc.txt.gz") for c in chunks]
+                    pd.concat([pd.read_csv(f, sep='\t', index_col=0, dtype=str) for f in chunk_files]).to_csv(
+                        os.path.join(args.output_dir, f"{args.prefix}.cis_qtl_top_assoc.txt.gz"), sep='\t')
+                    for f in chunk_files:
+                        os.remove(f)
 
-    elif args.mode == 'cis_susie':
-        if args.cis_output.endswith('.parquet'):
-            signif_df = pd.read_parquet(args.cis_output)
-        else:
-            signif_df = pd.read_csv(args.cis_output, sep='\t')
-        if 'qval' in signif_df:  # otherwise input is from get_significant_pairs
-            signif_df = signif_df[signif_df['qval'] <= args.fdr]
-        phenotype_ids = phenotype_df.index[phenotype_df.index.isin(signif_df['phenotype_id'].unique())]
-        phenotype_df = phenotype_df.loc[phenotype_ids]
-        phenotype_pos_df = phenotype_pos_df.loc[phenotype_ids]
-        if args.chunk_size is None:
-            summary_df, res = susie.map(genotype_df, variant_df, phenotype_df, phenotype_pos_df,
-                                        covariates_df, paired_covariate_df=paired_covariate_df, L=args.max_effects,
-                                        maf_threshold=maf_threshold, max_iter=500, window=args.window, summary_only=False)
-        else:
-            summary_df = []
-            res = {}
-            for gt_df, var_df, p_df, p_pos_df, _ in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
-                                                                                      dosages=args.dosages, verbose=True):
-                chunk_summary_df, chunk_res = susie.map(gt_df, var_df, p_df, p_pos_df,
-                                                        covariates_df, paired_covariate_df=paired_covariate_df, L=args.max_effects,
-                                                        maf_threshold=maf_threshold, max_iter=500, window=args.window, summary_only=False)
-                summary_df.append(chunk_summary_df)
-                res |= chunk_res
-            summary_df = pd.concat(summary_df).reset_index(drop=True)
+        elif args.mode == 'cis_independent':
+            summary_df = read_cis_output(args.cis_output)
+            summary_df.rename(columns={'minor_allele_samples':'ma_samples', 'minor_allele_count':'ma_count'}, inplace=True)
+            if args.chunk_size is None:
+                res_df = cis.map_independent(genotype_df, variant_df, summary_df, phenotype_df, phenotype_pos_df, covariates_df=covariates_df,
+                                             group_s=group_s, fdr=args.fdr, nperm=args.permutations, window=args.window,
+                                             maf_threshold=maf_threshold, logger=logger, seed=args.seed, verbose=True)
+            else:
+                res_df = []
+                for gt_df, var_df, p_df, p_pos_df, _ in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
+                                                                                          dosages=args.dosages, verbose=True):
+                    res_df.append(cis.map_independent(gt_df, var_df, summary_df, p_df, p_pos_df, covariates_df=covariates_df,
+                                                      group_s=group_s, fdr=args.fdr, nperm=args.permutations, window=args.window,
+                                                      maf_threshold=maf_threshold, logger=logger, seed=args.seed, verbose=True))
+                res_df = pd.concat(res_df).reset_index(drop=True)
+            logger.write('  * writing output')
+            out_file = os.path.join(args.output_dir, f'{args.prefix}.cis_independent_qtl.txt.gz')
+            write_tsv(res_df, out_file, index=False)
 
-        summary_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.SuSiE_summary.parquet'))
-        with open(os.path.join(args.output_dir, f'{args.prefix}.SuSiE.pickle'), 'wb') as f:
-            pickle.dump(res, f)
+        elif args.mode == 'cis_susie':
+            signif_df = read_cis_output(args.cis_output)
+            if 'phenotype_id' not in signif_df:  # cis-QTL summaries are indexed by phenotype_id
+                signif_df = signif_df.reset_index()
+            if 'qval' in signif_df:  # otherwise input is from get_significant_pairs
+                signif_df = signif_df[signif_df['qval'] <= args.fdr]
+                signif_ids = signif_df['phenotype_id'].unique()
+            else:  # potentially millions of variant-phenotype pairs; deduplicate via dictionary encoding
+                signif_ids = signif_df['phenotype_id'].astype('category').cat.categories
+            phenotype_ids = phenotype_df.index[phenotype_df.index.isin(signif_ids)]
+            phenotype_df = phenotype_df.loc[phenotype_ids]
+            phenotype_pos_df = phenotype_pos_df.loc[phenotype_ids]
+            if args.chunk_size is None:
+                with amp_context:
+                    summary_df, res = susie.map(genotype_df, variant_df, phenotype_df, phenotype_pos_df,
+                                                covariates_df, paired_covariate_df=paired_covariate_df, L=args.max_effects,
+                                                maf_threshold=maf_threshold, max_iter=500, window=args.window, summary_only=False)
+            else:
+                summary_df = []
+                res = {}
+                for gt_df, var_df, p_df, p_pos_df, _ in genotypeio.generate_paired_chunks(pgr, phenotype_df, phenotype_pos_df, args.chunk_size,
+                                                                                          dosages=args.dosages, verbose=True):
+                    with amp_context:
+                        chunk_summary_df, chunk_res = susie.map(gt_df, var_df, p_df, p_pos_df,
+                                                                covariates_df, paired_covariate_df=paired_covariate_df, L=args.max_effects,
+                                                                maf_threshold=maf_threshold, max_iter=500, window=args.window, summary_only=False)
+                    summary_df.append(chunk_summary_df)
+                    res |= chunk_res
+                summary_df = pd.concat(summary_df).reset_index(drop=True)
 
-    elif args.mode == 'trans_susie':
-        assert args.susie_loci is not None
-        if args.susie_loci.endswith('.parquet'):
-            locus_df = pd.read_parquet(args.susie_loci)
-        else:
-            locus_df = pd.read_csv(args.susie_loci, sep='\t')
-        locus_df.rename(columns={'position':'pos'}, inplace=True)
-        if args.chunk_size is None:
-            assert variant_df is not None
-            summary_df, res = susie.map_loci(locus_df, genotype_df, variant_df, phenotype_df, covariates_df,
-                                             maf_threshold=maf_threshold, max_iter=500, window=args.window)
-        else:
-            raise NotImplementedError()
+            summary_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.SuSiE_summary.parquet'))
+            with open(os.path.join(args.output_dir, f'{args.prefix}.SuSiE.pickle'), 'wb') as f:
+                pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-        summary_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.SuSiE_summary.parquet'))
-        with open(os.path.join(args.output_dir, f'{args.prefix}.SuSiE.pickle'), 'wb') as f:
-            pickle.dump(res, f)
+        elif args.mode == 'trans_susie':
+            assert args.susie_loci is not None
+            if args.susie_loci.endswith('.parquet'):
+                locus_df = pd.read_parquet(args.susie_loci)
+            else:
+                locus_df = pd.read_csv(args.susie_loci, sep='\t')
+            locus_df.rename(columns={'position':'pos'}, inplace=True)
+            if args.chunk_size is None:
+                assert variant_df is not None
+                summary_df, res = susie.map_loci(locus_df, genotype_df, variant_df, phenotype_df, covariates_df,
+                                                 maf_threshold=maf_threshold, max_iter=500, window=args.window)
+            else:
+                raise NotImplementedError()
 
-    elif args.mode == 'trans':
-        return_sparse = not args.return_dense
-        if return_sparse:
-            logger.write(f'  * p-value threshold: {args.pval_threshold:.2g}')
+            summary_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.SuSiE_summary.parquet'))
+            with open(os.path.join(args.output_dir, f'{args.prefix}.SuSiE.pickle'), 'wb') as f:
+                pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
 
-        if interaction_df is not None:
-            if interaction_df.shape[1] > 1:
-                raise NotImplementedError('trans-QTL mapping currently only supports a single interaction.')
-            else:
-                interaction_df = interaction_df.squeeze('columns')
+        elif args.mode == 'trans':
+            return_sparse = not args.return_dense
+            if return_sparse:
+                logger.write(f'  * p-value threshold: {args.pval_threshold:.2g}')
 
-        if args.chunk_size is None:
-            pairs_df = trans.map_trans(genotype_df, phenotype_df, covariates_df=covariates_df, interaction_s=interaction_df,
-                                       return_sparse=return_sparse, pval_threshold=args.pval_threshold,
-                                       maf_threshold=maf_threshold, batch_size=args.batch_size,
-                                       return_r2=args.return_r2, logger=logger)
-            if args.return_dense:
-                pval_df, b_df, b_se_df, af_s = pairs_df
-        else:
-            pairs_df = []
-            n, rem = np.divmod(pgr.num_variants, int(args.chunk_size))
-            bounds = [0] + n * [int(args.chunk_size)]
-            if rem != 0:
-                bounds.append(rem)
-            bounds = np.cumsum(bounds)
-            nchunks = len(bounds)-1
-            for i in range(nchunks):
-                print(f"Processing genotype chunk {i+1}/{nchunks}")
-                if args.dosages:
-                    gt_df = pgr.read_dosages_range(bounds[i], bounds[i+1]-1, dtype=np.float32)
+            if interaction_df is not None:
+                if interaction_df.shape[1] > 1:
+                    raise NotImplementedError('trans-QTL mapping currently only supports a single interaction.')
                 else:
-                    gt_df = pgr.read_range(bounds[i], bounds[i+1]-1, impute_mean=False, dtype=np.int8)
-                pairs_df.append(trans.map_trans(gt_df, phenotype_df, covariates_df=covariates_df, interaction_s=interaction_df,
-                                                return_sparse=return_sparse, pval_threshold=args.pval_threshold,
-                                                maf_threshold=maf_threshold, batch_size=args.batch_size,
-                                                return_r2=args.return_r2, logger=logger))
-            pairs_df = pd.concat(pairs_df).reset_index(drop=True)
-            variant_df = pgr.variant_df
+                    interaction_df = interaction_df.squeeze('columns')
 
-        if return_sparse:
-            if variant_df is not None and phenotype_pos_df is not None:
-                logger.write('  * filtering out cis-QTLs (within +/-5Mb)')
-                pairs_df = trans.filter_cis(pairs_df, phenotype_pos_df, variant_df, window=5000000)
+            if args.chunk_size is None:
+                with amp_context:
+                    pairs_df = trans.map_trans(genotype_df, phenotype_df, covariates_df=covariates_df, interaction_s=interaction_df,
+                                               return_sparse=return_sparse, pval_threshold=args.pval_threshold,
+                                               maf_threshold=maf_threshold, batch_size=args.batch_size,
+                                               return_r2=args.return_r2, logger=logger)
+                if args.return_dense:
+                    pval_df, b_df, b_se_df, af_s = pairs_df
+            else:
+                pairs_df = []
+                n, rem = np.divmod(pgr.num_variants, int(args.chunk_size))
+                bounds = [0] + n * [int(args.chunk_size)]
+                if rem != 0:
+                    bounds.append(rem)
+                bounds = np.cumsum(bounds)
+                nchunks = len(bounds)-1
+                for i in range(nchunks):
+                    print(f"Processing genotype chunk {i+1}/{nchunks}")
+                    if args.dosages:
+                        gt_df = pgr.read_dosages_range(bounds[i], bounds[i+1]-1, dtype=np.float32)
+                    else:
+                        gt_df = pgr.read_range(bounds[i], bounds[i+1]-1, impute_mean=False, dtype=np.int8)
+                    with amp_context:
+                        pairs_df.append(trans.map_trans(gt_df, phenotype_df, covariates_df=covariates_df, interaction_s=interaction_df,
+                                                        return_sparse=return_sparse, pval_threshold=args.pval_threshold,
+                                                        maf_threshold=maf_threshold, batch_size=args.batch_size,
+                                                        return_r2=args.return_r2, logger=logger))
+                pairs_df = pd.concat(pairs_df).reset_index(drop=True)
+                variant_df = pgr.variant_df
 
-            logger.write('  * writing sparse output')
-            if not args.output_text:
-                pairs_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_pairs.parquet'))
+            if return_sparse:
+                if variant_df is not None and phenotype_pos_df is not None:
+                    logger.write('  * filtering out cis-QTLs (within +/-5Mb)')
+                    pairs_df = trans.filter_cis(pairs_df, phenotype_pos_df, variant_df, window=5000000)
+
+                logger.write('  * writing sparse output')
+                if not args.output_text:
+                    pairs_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_pairs.parquet'), compression='zstd')
+                else:
+                    out_file = os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_pairs.txt.gz')
+                    pairs_df.to_csv(out_file, sep='\t', index=False, float_format='%.6g')
             else:
-                out_file = os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_pairs.txt.gz')
-                pairs_df.to_csv(out_file, sep='\t', index=False, float_format='%.6g')
-        else:
-            logger.write('  * writing dense output')
-            pval_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_pval.parquet'))
-            b_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_beta.parquet'))
-            b_se_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_beta_se.parquet'))
-            af_s.to_frame().to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_af.parquet'))
+                logger.write('  * writing dense output')
+                pval_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_pval.parquet'), compression='zstd')
+                b_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_beta.parquet'), compression='zstd')
+                b_se_df.to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_beta_se.parquet'), compression='zstd')
+                af_s.to_frame().to_parquet(os.path.join(args.output_dir, f'{args.prefix}.trans_qtl_af.parquet'), compression='zstd')
 
     logger.write(f'[{datetime.now().strftime("%b %d %H:%M:%S")}] Finished mapping')
 
@@ -13,41 +13,32 @@ import genotypeio
 from core import *
 
 
-def _in_cis(chrom, pos, gene_id, pos_dict, window=1000000):
-    """Test if a variant is within +/-window of a gene's TSS."""
-    if chrom == pos_dict[gene_id]['chr']:
-        gene_dict = pos_dict[gene_id]
-        if 'pos' in gene_dict:
-            start = gene_dict['pos']
-            end = start
-        else:
-            start = gene_dict['start']
-            end = gene_dict['end']
-        if pos >= start - window and pos <= end + window:
-            return True
-        else:
-            return False
-    else:
-        return False
-
-
 def filter_cis(pairs_df, phenotype_pos_df, variant_df, window=5000000):
     """Filter out cis-QTLs
 
     Args:
         pairs_df: sparse output from map_trans()
-        pos_dict: phenotype_id -> pos
+        phenotype_pos_df: DataFrame with phenotype positions, with columns ['chr', 'pos'] or ['chr', 'start', 'end']
         window: filter variants within +/-window of feature position (e.g., TSS for genes)
     """
-    pos_dict = phenotype_pos_df.T.to_dict()
-    variant_df = variant_df.loc[pairs_df['variant_id'].unique()].copy()
-    variant_dict = {v:{'chrom':c, 'pos':p} for v,c,p in zip(variant_df.index, variant_df['chrom'], variant_df['pos'])}
-
-    drop_ix = []
-    for k,gene_id,variant_id in zip(pairs_df['phenotype_id'].index, pairs_df['phenotype_id'], pairs_df['variant_id']):
-        if _in_cis(variant_dict[variant_id]['chrom'], variant_dict[variant_id]['pos'], gene_id, pos_dict, window=window):
-            drop_ix.append(k)
-    return pairs_df.drop(drop_ix)
+    if 'pos' in phenotype_pos_df:
+        start_s = phenotype_pos_df['pos']
+        end_s = phenotype_pos_df['pos']
+    else:
+        start_s = phenotype_pos_df['start']
+        end_s = phenotype_pos_df['end']
+
+    phenotype_ix = phenotype_pos_df.index.get_indexer(pairs_df['phenotype_id'])
+    assert (phenotype_ix >= 0).all(), "Phenotype IDs in pairs_df must be present in phenotype_pos_df"
+    variant_ix = variant_df.index.get_indexer(pairs_df['variant_id'])
+    assert (variant_ix >= 0).all(), "Variant IDs in pairs_df must be present in variant_df"
+    variant_pos = variant_df['pos'].values[variant_ix]
+    cis_mask = (
+        (phenotype_pos_df['chr'].values[phenotype_ix] == variant_df['chrom'].values[variant_ix])
+        & (variant_pos >= start_s.values[phenotype_ix] - window)
+        & (variant_pos <= end_s.values[phenotype_ix] + window)
+    )
+    return pairs_df[~cis_mask]
 
 
 def map_trans(genotype_df, phenotype_df, covariates_df=None, interaction_s=None,
@@ -225,11 +216,12 @@ def map_trans(genotype_df, phenotype_df, covariates_df=None, interaction_s=None,
                     # regression
                     X_t = torch.stack([g0_t, i0_t.repeat(ng, 1), gi0_t], 2)  # ng x ns x 3
                     Xinv = torch.matmul(torch.transpose(X_t, 1, 2), X_t).inverse() # ng x 3 x 3
-                    b_t = torch.matmul(torch.matmul(Xinv, torch.transpose(X_t, 1, 2)), p0_t.t())  # ng x 3 x np
+                    # cast back to float32 in case of autocast (no-op otherwise)
+                    b_t = torch.matmul(torch.matmul(Xinv, torch.transpose(X_t, 1, 2)), p0_t.t()).float()  # ng x 3 x np
                     dof = residualizer.dof - 2
 
-                    rss_t = (torch.matmul(X_t, b_t) - p0_t.t()).pow(2).sum(1)  # ng x np
-                    b_se_t = torch.sqrt(Xinv[:, torch.eye(3, dtype=torch.uint8).bool()].unsqueeze(-1).repeat([1,1,nps]) * rss_t.unsqueeze(1).repeat([1,3,1]) / dof)
+                    rss_t = (torch.matmul(X_t, b_t).float() - p0_t.t()).pow(2).sum(1)  # ng x np
+                    b_se_t = torch.sqrt(Xinv.float()[:, torch.eye(3, dtype=torch.uint8).bool()].unsqueeze(-1).repeat([1,1,nps]) * rss_t.unsqueeze(1).repeat([1,3,1]) / dof)
                     tstat_t = (b_t.double() / b_se_t.double()).float()  # (ng x 3 x np)
                     tstat_g_t =  tstat_t[:,0,:]  # genotypes x phenotypes
                     tstat_i_t =  tstat_t[:,1,:]